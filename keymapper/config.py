@@ -222,29 +222,34 @@ class GlobalConfig(ConfigBase):
     def load_config(self, path=None):
         """Load the config from the file system.
 
+        Returns False if the provided path does not exist, True otherwise.
+
         Parameters
         ----------
         path : string or None
             If set, will change the path to load from and save to.
         """
-        if path is not None:
-            if not os.path.exists(path):
+        try:
+            # open it only once instead of checking if it exists first
+            file = open(path or self.path, 'r')
+        except FileNotFoundError:
+            if path is not None:
                 logger.error('Config at "%s" not found', path)
-                return
-
-            self.path = path
+                return False
 
-        self.clear_config()
-
-        if not os.path.exists(self.path):
             # treated like an empty config
             logger.debug('Config "%s" doesn\'t exist yet', self.path)
             self.clear_config()
             self._config = copy.deepcopy(INITIAL_CONFIG)
             self.save_config()
-            return
+            return True
 
-        with open(self.path, 'r') as file:
+        if path is not None:
+            self.path = path
+
+        self.clear_config()
+
+        with file:
             try:
                 self._config.update(json.load(file))
                 logger.info('Loaded config from "%s"', self.path)
@@ -256,6 +261,8 @@ class GlobalConfig(ConfigBase):
                 # uses the default configuration when the config object
                 # is empty automatically
 
+        return True
+
     def save_config(self):
         """Save the config to the file system."""
         if USER == 'root':
@@ -265,9 +272,8 @@ class GlobalConfig(ConfigBase):
         touch(self.path)
 
         with open(self.path, 'w') as file:
-            json.dump(self._config, file, indent=4)
+            file.write(json.dumps(self._config, indent=4) + '\n')
             logger.info('Saved config to %s', self.path)
-            file.write('\n')
 
 
 config = GlobalConfig()
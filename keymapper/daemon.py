@@ -30,6 +30,8 @@ import sys
 import json
 import time
 import atexit
+import subprocess
+import collections
 
 from pydbus import SystemBus
 import gi
@@ -41,27 +43,68 @@ from keymapper.injection.injector import Injector, UNKNOWN
 from keymapper.mapping import Mapping
 from keymapper.config import config
 from keymapper.state import system_mapping
-from keymapper.groups import groups
+from keymapper.groups import groups, DEV_NAME
 
 
 BUS_NAME = 'keymapper.Control'
 
+# udev triggers autoloading multiple times per hardware event. Requests
+# within this many milliseconds are collapsed into a single autoload.
+AUTOLOAD_DEBOUNCE = 200
+
+# Evaluated once. Like everywhere else, this module is supposed to be
+# imported after update_verbosity was called.
+_DEBUG_ARGS = ['-d'] if is_debug() else []
+
+# how many milliseconds to wait for the service to appear on the bus after
+# starting it
+SERVICE_START_TIMEOUT = 1000
+
+
+def _wait_for_bus_name(bus, timeout):
+    """Block until BUS_NAME is owned by someone or timeout ms passed."""
+    loop = GLib.MainLoop()
+    timed_out = False
+
+    def on_timeout():
+        nonlocal timed_out
+        timed_out = True
+        loop.quit()
+        return False
+
+    timeout_id = GLib.timeout_add(timeout, on_timeout)
+    # name_appeared is also called if the name already has an owner
+    watch = bus.watch_name(BUS_NAME, name_appeared=lambda *_: loop.quit())
+    loop.run()
+    watch.unwatch()
+
+    if not timed_out:
+        GLib.source_remove(timeout_id)
+
+
+_AutoloadEntry = collections.namedtuple(
+    '_AutoloadEntry',
+    ['timestamp', 'preset']
+)
+
 
 class AutoloadHistory:
     """Contains the autoloading history and constraints."""
     def __init__(self):
         """Construct this with an empty history."""
-        # mapping of device -> (timestamp, preset)
+        # mapping of device -> _AutoloadEntry
         self._autoload_history = {}
 
     def remember(self, group_key, preset):
         """Remember when this preset was autoloaded for the device."""
-        self._autoload_history[group_key] = (time.time(), preset)
+        self._autoload_history[group_key] = _AutoloadEntry(
+            time.monotonic(),
+            preset
+        )
 
     def forget(self, group_key):
         """The injection was stopped or started by hand."""
-        if group_key in self._autoload_history:
-            del self._autoload_history[group_key]
+        self._autoload_history.pop(group_key, None)
 
     def may_autoload(self, group_key, preset):
         """Check if this autoload would be redundant.
@@ -75,10 +118,11 @@ class AutoloadHistory:
         timeframe which will then not ask for autoloading again. Wait 3
         seconds between replugging.
         """
-        if group_key not in self._autoload_history:
+        entry = self._autoload_history.get(group_key)
+        if entry is None:
             return True
 
-        if self._autoload_history[group_key][1] != preset:
+        if entry.preset != preset:
             return True
 
         # bluetooth devices go to standby mode after some time. After a
@@ -87,9 +131,9 @@ class AutoloadHistory:
         # mouse until the daemon is asked to autoload again. Redundant calls
         # by udev to autoload for the device seem to happen within 0.2
         # seconds in my case.
-        now = time.time()
+        now = time.monotonic()
         threshold = 15  # seconds
-        if self._autoload_history[group_key][0] < now - threshold:
+        if entry.timestamp < now - threshold:
             return True
 
         return False
@@ -145,14 +189,23 @@ class Daemon:
         logger.debug('Creating daemon')
         self.injectors = {}
         self.config_dir = None
+        # the presets directory within config_dir
+        self._presets_dir = None
 
         self.autoload_history = AutoloadHistory()
-        self.refreshed_devices_at = 0
+        # time.monotonic() of the most recent groups.refresh, None if never
+        self.refreshed_devices_at = None
+
+        # ((path, mtime, size), xmodmap) of the most recently read xmodmap
+        self._xmodmap_cache = None
+
+        # mapping of group_key -> GLib source id of the pending autoload
+        self._autoload_timeouts = {}
 
         atexit.register(self.stop_all)
 
     @classmethod
-    def connect(cls, fallback=True):
+    def connect(cls, fallback=True, bus=None, run=None):
         """Get an interface to start and stop injecting keystrokes.
 
         Parameters
@@ -160,9 +213,19 @@ class Daemon:
         fallback : bool
             If true, returns an instance of the daemon instead if it cannot
             connect
+        bus : pydbus.bus.Bus
+            Defaults to the SystemBus
+        run : callable
+            Used to start the service. Defaults to subprocess.run
         """
+        if run is None:
+            run = subprocess.run
+
         try:
-            bus = SystemBus()
+            # fails as well if the system bus is not available yet
+            if bus is None:
+                bus = SystemBus()
+
             interface = bus.get(BUS_NAME)
             logger.info('Connected to the service')
         except GLib.GError as error:
@@ -174,30 +237,33 @@ class Daemon:
             # Blocks until pkexec is done asking for the password.
             # Runs via key-mapper-control so that auth_admin_keep works
             # for all pkexec calls of the gui
-            debug = ' -d' if is_debug() else ''
-            cmd = f'pkexec key-mapper-control --command start-daemon {debug}'
+            cmd = [
+                'pkexec', 'key-mapper-control', '--command', 'start-daemon',
+                *_DEBUG_ARGS
+            ]
 
             # using pkexec will also cause the service to continue running in
             # the background after the gui has been closed, which will keep
             # the injections ongoing
 
-            logger.debug('Running `%s`', cmd)
-            os.system(cmd)
-            time.sleep(0.2)
-
-            # try a few times if the service was just started
-            for attempt in range(3):
-                try:
-                    interface = bus.get(BUS_NAME)
-                    break
-                except GLib.GError as error:
-                    logger.debug(
-                        'Attempt %d to connect to the service failed: "%s"',
-                        attempt + 1, error
-                    )
-                time.sleep(0.2)
-            else:
-                logger.error('Failed to connect to the service')
+            if _DEBUG_ARGS:
+                # avoid joining the command if it isn't logged anyway
+                logger.debug('Running `%s`', ' '.join(cmd))
+            try:
+                run(cmd)
+            except OSError as error:
+                # for example if pkexec is not installed
+                logger.error('Failed to start the service: "%s"', error)
+                sys.exit(1)
+
+            # the service daemonizes, wait until it is available instead of
+            # polling for it
+            _wait_for_bus_name(bus, SERVICE_START_TIMEOUT)
+
+            try:
+                interface = bus.get(BUS_NAME)
+            except GLib.GError as error:
+                logger.error('Failed to connect to the service: "%s"', error)
                 sys.exit(1)
 
         return interface
@@ -217,25 +283,55 @@ class Daemon:
         logger.debug('Running daemon')
         loop.run()
 
-    def refresh(self, group_key=None):
-        """Refresh groups if the specified group is unknown.
+    def refresh(self, *group_keys):
+        """Refresh groups if one of the specified groups is unknown.
+
+        Refreshes at most once, no matter how many groups are unknown.
 
         Parameters
         ----------
-        group_key : str
-            unique identifier used by the groups object
+        group_keys : str
+            unique identifiers used by the groups object
         """
-        now = time.time()
-        if now - 10 > self.refreshed_devices_at:
+        # monotonic, so that changes of the system time, e.g. after
+        # suspending, don't mess with the timeframe
+        now = time.monotonic()
+        too_old = (
+            self.refreshed_devices_at is None
+            or now - 10 > self.refreshed_devices_at
+        )
+        if too_old:
             logger.debug('Refreshing because last info is too old')
             groups.refresh()
             self.refreshed_devices_at = now
             return
 
-        if not groups.find(key=group_key):
-            logger.debug('Refreshing because "%s" is unknown', group_key)
-            groups.refresh()
-            self.refreshed_devices_at = now
+        for group_key in group_keys:
+            if not groups.find(key=group_key):
+                logger.debug('Refreshing because "%s" is unknown', group_key)
+                groups.refresh()
+                self.refreshed_devices_at = now
+                return
+
+    def _load_xmodmap(self, path):
+        """Read the xmodmap dump, unless it didn't change since the last time.
+
+        Raises FileNotFoundError if it doesn't exist.
+
+        Parameters
+        ----------
+        path : str
+            path to the xmodmap.json file in the users config dir
+        """
+        stat = os.stat(path)
+        cache_key = (path, stat.st_mtime_ns, stat.st_size)
+        if self._xmodmap_cache is None or self._xmodmap_cache[0] != cache_key:
+            with open(path, 'r') as file:
+                self._xmodmap_cache = (cache_key, json.load(file))
+        else:
+            logger.spam('"%s" did not change', path)
+
+        return self._xmodmap_cache[1]
 
     def stop_injecting(self, group_key):
         """Stop injecting the mapping for a single device."""
@@ -267,30 +363,37 @@ class Daemon:
             presets directory
         """
         config_path = os.path.join(config_dir, 'config.json')
-        if not os.path.exists(config_path):
-            logger.error('"%s" does not exist', config_path)
+        if not config.load_config(config_path):
+            # doesn't exist
             return
 
         self.config_dir = config_dir
-        config.load_config(config_path)
+        self._presets_dir = os.path.join(config_dir, 'presets')
 
-    def _autoload(self, group_key):
+    def _autoload(self, group_key, preset=None):
         """Check if autoloading is a good idea, and if so do it.
 
         Parameters
         ----------
         group_key : str
             unique identifier used by the groups object
+        preset : str or None
+            The configured autoload preset of the group, if the caller
+            already knows it. Otherwise it is read from the config.
         """
         self.refresh(group_key)
+        self._autoload_no_refresh(group_key, preset)
 
+    def _autoload_no_refresh(self, group_key, preset=None):
+        """Like _autoload, but assumes that the groups were just refreshed."""
         group = groups.find(key=group_key)
         if group is None:
             # even after groups.refresh, the device is unknown, so it's
             # either not relevant for key-mapper, or not connected yet
             return
 
-        preset = config.get(['autoload', group.key], log_unknown=False)
+        if preset is None:
+            preset = config.get(['autoload', group.key], log_unknown=False)
 
         if preset is None:
             # no autoloading is configured for this device
@@ -318,6 +421,8 @@ class Daemon:
         """Inject the configured autoload preset for the device.
 
         If the preset is already being injected, it won't autoload it again.
+        Happens asynchronously in the GLib loop after AUTOLOAD_DEBOUNCE
+        milliseconds, repeated requests in the meantime restart the timer.
 
         Parameters
         ----------
@@ -325,7 +430,7 @@ class Daemon:
             unique identifier used by the groups object
         """
         # avoid some confusing logs and filter obviously invalid requests
-        if group_key.startswith('key-mapper'):
+        if group_key.startswith(DEV_NAME):
             return
 
         logger.info('Request to autoload for "%s"', group_key)
@@ -339,7 +444,24 @@ class Daemon:
             )
             return
 
+        # restart the timer for each request, so that only the last one of
+        # a burst actually autoloads
+        timeout = self._autoload_timeouts.pop(group_key, None)
+        if timeout is not None:
+            GLib.source_remove(timeout)
+
+        self._autoload_timeouts[group_key] = GLib.timeout_add(
+            AUTOLOAD_DEBOUNCE,
+            self._debounced_autoload,
+            group_key
+        )
+
+    def _debounced_autoload(self, group_key):
+        """Autoload after no further request arrived for the group."""
+        self._autoload_timeouts.pop(group_key, None)
         self._autoload(group_key)
+        # don't repeat the timeout
+        return False
 
     def autoload(self):
         """Load all autoloaded presets for the current config_dir.
@@ -353,16 +475,22 @@ class Daemon:
             )
             return
 
-        autoload_presets = list(config.iterate_autoload_presets())
+        # A copy, because broken entries are removed from the config
+        # while iterating. This is the only copy that is made.
+        autoload_presets = dict(config.iterate_autoload_presets())
 
         logger.info('Autoloading for all devices')
 
-        if len(autoload_presets) == 0:
+        if not autoload_presets:
             logger.error('No presets configured to autoload')
             return
 
-        for group_key, _ in autoload_presets:
-            self._autoload(group_key)
+        # a single refresh for all of them, instead of one for each
+        # group that is unknown
+        self.refresh(*autoload_presets)
+
+        for group_key, preset in autoload_presets.items():
+            self._autoload_no_refresh(group_key, preset)
 
     def start_injecting(self, group_key, preset):
         """Start injecting the preset for the device.
@@ -393,8 +521,7 @@ class Daemon:
             return False
 
         preset_path = os.path.join(
-            self.config_dir,
-            'presets',
+            self._presets_dir,
             group.name,
             f'{preset}.json'
         )
@@ -415,14 +542,14 @@ class Daemon:
         # systemd.
         xmodmap_path = os.path.join(self.config_dir, 'xmodmap.json')
         try:
-            with open(xmodmap_path, 'r') as file:
-                # do this for each injection to make sure it is up to
-                # date when the system layout changes.
-                xmodmap = json.load(file)
-                logger.debug('Using keycodes from "%s"', xmodmap_path)
-                system_mapping.update(xmodmap)
-                # the service now has process wide knowledge of xmodmap
-                # keys of the users session
+            # do this for each injection to make sure it is up to
+            # date when the system layout changes. It is only parsed again
+            # if the file was modified.
+            xmodmap = self._load_xmodmap(xmodmap_path)
+            logger.debug('Using keycodes from "%s"', xmodmap_path)
+            system_mapping.update(xmodmap)
+            # the service now has process wide knowledge of xmodmap
+            # keys of the users session
         except FileNotFoundError:
             logger.error('Could not find "%s"', xmodmap_path)
 
@@ -438,10 +565,27 @@ class Daemon:
         return True
 
     def stop_all(self):
-        """Stop all injections."""
+        """Stop all injections and forget about their injectors."""
         logger.info('Stopping all injections')
-        for group_key in list(self.injectors.keys()):
-            self.stop_injecting(group_key)
+
+        # and don't start new ones from pending autoload requests
+        for timeout in self._autoload_timeouts.values():
+            GLib.source_remove(timeout)
+        self._autoload_timeouts = {}
+
+        # stopped injectors are not needed anymore, so empty the dict while
+        # stopping them
+        while self.injectors:
+            group_key, injector = self.injectors.popitem()
+            try:
+                injector.stop_injecting()
+            except OSError as error:
+                # keep stopping the other ones
+                logger.error(
+                    'Failed to stop injecting for "%s": %s',
+                    group_key, error
+                )
+            self.autoload_history.forget(group_key)
 
     def hello(self, out):
         """Used for tests."""
@@ -61,6 +61,9 @@ GRAPHICS_TABLET = 'graphics-tablet'
 CAMERA = 'camera'
 UNKNOWN = 'unknown'
 
+# name and phys of the devices created by key-mapper
+DEV_NAME = 'key-mapper'
+
 
 if not hasattr(evdev.InputDevice, 'path'):
     # for evdev < 1.0.0 patch the path property
@@ -402,8 +405,28 @@ class _Groups:
     """Contains and manages all groups."""
     def __init__(self):
         self._groups = {}
+        # map paths in /dev/input, keys and names to their group,
+        # for fast lookups
+        self._path_index = {}
+        self._key_index = {}
+        self._name_index = {}
         self._find_groups()
 
+    def _update_index(self):
+        """Build the lookup tables for the current groups.
+
+        Has to be called whenever self._groups is replaced.
+        """
+        self._path_index = {}
+        self._key_index = {}
+        self._name_index = {}
+        for group in self._groups:
+            # like find, the first group that matches wins
+            for path in group.paths:
+                self._path_index.setdefault(path, group)
+            self._key_index.setdefault(group.key, group)
+            self._name_index.setdefault(group.name, group)
+
     def refresh(self):
         """This can be called to discover new devices.
 
@@ -438,7 +461,7 @@ class _Groups:
         result = []
         for group in self._groups:
             name = group.name
-            if not include_keymapper and name.startswith('key-mapper'):
+            if not include_keymapper and name.startswith(DEV_NAME):
                 continue
 
             result.append(group)
@@ -448,12 +471,13 @@ class _Groups:
     def set_groups(self, new_groups):
         """Overwrite all groups."""
         self._groups = new_groups
+        self._update_index()
 
     def list_group_names(self):
         """Return a list of all 'name' properties of the groups."""
         return [
             group.name for group in self._groups
-            if not group.name.startswith('key-mapper')
+            if not group.name.startswith(DEV_NAME)
         ]
 
     def __len__(self):
@@ -469,6 +493,7 @@ class _Groups:
     def loads(self, dump):
         """Load a serialized representation created via dumps."""
         self._groups = [_Group.loads(group) for group in json.loads(dump)]
+        self._update_index()
 
     def find(self, name=None, key=None, path=None):
         """Find a group that matches the provided parameters.
@@ -483,19 +508,25 @@ class _Groups:
         path : str
             "/dev/input/event3"
         """
-        for group in self._groups:
-            if name and group.name != name:
-                continue
+        if path:
+            group = self._path_index.get(path)
+        elif key:
+            group = self._key_index.get(key)
+        elif name:
+            group = self._name_index.get(name)
+        else:
+            return next(iter(self._groups), None)
 
-            if key and group.key != key:
-                continue
+        if group is None:
+            return None
 
-            if path and path not in group.paths:
-                continue
+        if name and group.name != name:
+            return None
 
-            return group
+        if key and group.key != key:
+            return None
 
-        return None
+        return group
 
 
 groups = _Groups()
@@ -30,7 +30,7 @@ import evdev
 from evdev.ecodes import EV_KEY, EV_REL
 
 from keymapper.logger import logger
-from keymapper.groups import classify, GAMEPAD
+from keymapper.groups import classify, GAMEPAD, DEV_NAME
 from keymapper import utils
 from keymapper.mapping import DISABLE_CODE
 from keymapper.injection.keycode_mapper import KeycodeMapper
@@ -40,8 +40,6 @@ from keymapper.injection.numlock import set_numlock, is_numlock_on, \
     ensure_numlock
 
 
-DEV_NAME = 'key-mapper'
-
 # messages
 CLOSE = 0
 OK = 1
@@ -56,6 +54,9 @@ STOPPED = 5
 # for both states and messages
 NO_GRAB = 6
 
+# once reached, the state of an injector doesn't change anymore
+FINAL_STATES = (FAILED, STOPPED, NO_GRAB)
+
 
 def is_in_capabilities(key, capabilities):
     """Are this key or one of its sub keys in the capabilities?
@@ -103,7 +104,17 @@ class Injector(multiprocessing.Process):
         """Get the state of the injection.
 
         Can be safely called from the main process.
+
+        The states form a state machine:
+        UNKNOWN -> STARTING -> RUNNING or NO_GRAB,
+        STARTING or RUNNING -> FAILED if the process died,
+        UNKNOWN, STARTING or RUNNING -> STOPPED by stop_injecting.
+        STOPPED, FAILED and NO_GRAB are final.
         """
+        if self._state in FINAL_STATES:
+            # no need to check the process or the pipe anymore
+            return self._state
+
         # slowly figure out what is going on
         alive = self.is_alive()
 
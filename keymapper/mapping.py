@@ -245,8 +245,7 @@ class Mapping(ConfigBase):
                 json_ready_mapping[new_key] = value
 
             preset_dict['mapping'] = json_ready_mapping
-            json.dump(preset_dict, file, indent=4)
-            file.write('\n')
+            file.write(json.dumps(preset_dict, indent=4) + '\n')
 
         self.changed = False
         self.num_saved_keys = len(self)
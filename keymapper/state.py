@@ -38,6 +38,10 @@ XKB_KEYCODE_OFFSET = 8
 
 XMODMAP_FILENAME = 'xmodmap.json'
 
+# matches lines like "keycode  64 = Alt_L Meta_L Alt_L Meta_L" of
+# `xmodmap -pke`
+XMODMAP_PATTERN = re.compile(r'(\d+) = (.+)\n')
+
 
 class SystemMapping:
     """Stores information about all available keycodes."""
@@ -69,8 +73,7 @@ class SystemMapping:
                 ['xmodmap', '-pke'],
                 stderr=subprocess.STDOUT
             ).decode()
-            xmodmap = xmodmap
-            self._xmodmap = re.findall(r'(\d+) = (.+)\n', xmodmap + '\n')
+            self._xmodmap = XMODMAP_PATTERN.findall(xmodmap + '\n')
             xmodmap_dict = self._find_legit_mappings()
         except (subprocess.CalledProcessError, FileNotFoundError):
             # might be within a tty
@@ -83,7 +86,7 @@ class SystemMapping:
             touch(path)
             with open(path, 'w') as file:
                 logger.debug('Writing "%s"', path)
-                json.dump(xmodmap_dict, file, indent=4)
+                file.write(json.dumps(xmodmap_dict, indent=4))
 
         for name, code in xmodmap_dict.items():
             self._set(name, code)
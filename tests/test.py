@@ -39,6 +39,7 @@ import evdev
 import gi
 gi.require_version('Gtk', '3.0')
 gi.require_version('GLib', '2.0')
+from gi.repository import GLib
 
 
 assert not os.getcwd().endswith('tests')
@@ -100,7 +101,11 @@ MIN_ABS = -2 ** 15
 MAX_ABS = 2 ** 15
 
 
-tmp = '/tmp/key-mapper-test'
+# keep the files that the tests write in memory if possible
+tmp = (
+    '/dev/shm/key-mapper-test' if os.access('/dev/shm', os.W_OK)
+    else '/tmp/key-mapper-test'
+)
 uinput_write_history = []
 # for tests that makes the injector create its processes
 uinput_write_history_pipe = multiprocessing.Pipe()
@@ -293,7 +298,7 @@ def new_event(type, code, value, timestamp=None, offset=0):
 
 def patch_paths():
     from keymapper import paths
-    paths.CONFIG_PATH = '/tmp/key-mapper-test'
+    paths.CONFIG_PATH = tmp
 
 
 class InputDevice:
@@ -486,6 +491,17 @@ def patch_os_system():
 
     os.system = system
 
+    # this replaces subprocess.run for the whole test process, so
+    # subprocess.check_output and the like, which call it, are guarded too
+    original_run = subprocess.run
+
+    def run(args, *pargs, **kwargs):
+        if 'pkexec' in args:
+            raise Exception('Write patches to avoid running pkexec stuff')
+        return original_run(args, *pargs, **kwargs)
+
+    subprocess.run = run
+
 
 def clear_write_history():
     """Empty the history in preparation for the next test."""
@@ -514,12 +530,15 @@ from keymapper.state import system_mapping, custom_mapping
 from keymapper.paths import get_config_path
 from keymapper.injection.macros import macro_variables
 from keymapper.injection.keycode_mapper import active_macros, unreleased
+from keymapper.daemon import AUTOLOAD_DEBOUNCE
 
 # no need for a high number in tests
 Injector.regrab_timeout = 0.05
 
 
 _fixture_copy = copy.deepcopy(fixtures)
+# the groups discovered from the original fixtures
+_groups_dump = None
 environ_copy = copy.deepcopy(os.environ)
 
 
@@ -534,6 +553,13 @@ def send_event_to_reader(event):
     })
 
 
+def wait_for_autoload():
+    """Run the pending debounced autoload_single calls of daemons."""
+    time.sleep(AUTOLOAD_DEBOUNCE / 1000 + 0.05)
+    while GLib.MainContext.default().iteration(False):
+        pass
+
+
 def quick_cleanup(log=True):
     """Reset the applications state."""
     if log:
@@ -621,7 +647,20 @@ def cleanup():
     time.sleep(0.05)
 
     quick_cleanup(log=False)
-    groups.refresh()
+    restore_groups()
+
+
+def restore_groups():
+    """Reset the groups to those of the original fixtures."""
+    global _groups_dump
+
+    # quick_cleanup restores the original fixtures, so discovering the groups
+    # again would always yield the same result. Only do it once.
+    if _groups_dump is None:
+        groups.refresh()
+        _groups_dump = groups.dumps()
+    else:
+        groups.loads(_groups_dump)
 
 
 def spy(obj, name):
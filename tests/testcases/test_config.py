@@ -164,6 +164,11 @@ class TestConfig(unittest.TestCase):
         self.assertEqual(config.get("a"), "b")
         self.assertEqual(config.get(["a"]), "b")
 
+        # unknown paths are refused
+        self.assertFalse(config.load_config(os.path.join(tmp, 'qux.json')))
+        self.assertEqual(config.path, config_2)
+        self.assertEqual(config.get("a"), "b")
+
 
 if __name__ == "__main__":
     unittest.main()
@@ -32,12 +32,12 @@ from importlib.machinery import SourceFileLoader
 
 from keymapper.state import custom_mapping
 from keymapper.config import config
-from keymapper.daemon import Daemon
+from keymapper.daemon import Daemon, _AutoloadEntry
 from keymapper.mapping import Mapping
 from keymapper.paths import get_preset_path
 from keymapper.groups import groups
 
-from tests.test import quick_cleanup, tmp
+from tests.test import quick_cleanup, tmp, wait_for_autoload
 
 
 def import_control():
@@ -137,6 +137,7 @@ class TestControl(unittest.TestCase):
         config.set_autoload_preset(groups_[1].key, presets[2])
         config.save_config()
         communicate(options('autoload', None, None, groups_[1].key, False, False, False), daemon)
+        wait_for_autoload()
         self.assertEqual(len(start_history), 4)
         self.assertEqual(start_history[3], (groups_[1].key, presets[2]))
         self.assertTrue(daemon.autoload_history.may_autoload(groups_[0].key, presets[0]))
@@ -145,6 +146,7 @@ class TestControl(unittest.TestCase):
         # autoloading for the same device again redundantly will not autoload
         # again
         communicate(options('autoload', None, None, groups_[1].key, False, False, False), daemon)
+        wait_for_autoload()
         self.assertEqual(len(start_history), 4)
         self.assertEqual(stop_counter, 3)
         self.assertFalse(daemon.autoload_history.may_autoload(groups_[1].key, presets[2]))
@@ -153,7 +155,7 @@ class TestControl(unittest.TestCase):
         self.assertTrue(daemon.autoload_history.may_autoload(groups_[1].key, 'quuuux'))
 
         # after 15 seconds it may be autoloaded again
-        daemon.autoload_history._autoload_history[groups_[1].key] = (time.time() - 16, presets[2])
+        daemon.autoload_history._autoload_history[groups_[1].key] = _AutoloadEntry(time.monotonic() - 16, presets[2])
         self.assertTrue(daemon.autoload_history.may_autoload(groups_[1].key, presets[2]))
 
     def test_autoload_other_path(self):
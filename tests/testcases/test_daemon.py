@@ -20,57 +20,53 @@
 
 
 import os
+import signal
 import multiprocessing
 import unittest
 import time
-import subprocess
 import json
 
 import evdev
 from evdev.ecodes import EV_KEY, EV_ABS
-from gi.repository import Gtk
-from pydbus import SystemBus
+from gi.repository import GLib
 
 from keymapper.state import custom_mapping, system_mapping
 from keymapper.config import config
 from keymapper.groups import groups
-from keymapper.paths import get_config_path, mkdir, get_preset_path
+from keymapper.paths import get_config_path, mkdir, get_preset_path, \
+    remove
 from keymapper.key import Key
 from keymapper.mapping import Mapping
 from keymapper.injection.injector import STARTING, RUNNING, STOPPED, UNKNOWN
 from keymapper.daemon import Daemon, BUS_NAME
 
-from tests.test import cleanup, uinput_write_history_pipe, new_event, \
-    push_events, is_service_running, fixtures, tmp
+from tests.test import quick_cleanup, uinput_write_history_pipe, new_event, \
+    push_events, is_service_running, fixtures, tmp, wait_for_autoload, \
+    restore_groups, spy
 
 
-def gtk_iteration():
-    """Iterate while events are pending."""
-    while Gtk.events_pending():
-        Gtk.main_iteration()
+def run_service():
+    """Replace the current process with the service, to keep the pid."""
+    os.execvp('key-mapper-service', ['key-mapper-service', '-d'])
 
 
 class TestDBusDaemon(unittest.TestCase):
     def setUp(self):
-        self.process = multiprocessing.Process(
-            target=os.system,
-            args=('key-mapper-service -d',)
-        )
+        # without a shell in between, so that self.process.pid is the pid
+        # of the service
+        self.process = multiprocessing.Process(target=run_service)
         self.process.start()
-        time.sleep(0.5)
 
-        # should not use pkexec, but rather connect to the previously
-        # spawned process
-        self.interface = Daemon.connect()
+        # The service might not own its bus name yet. Instead of running
+        # pkexec, connect waits for the previously spawned process to
+        # appear on the bus
+        self.interface = Daemon.connect(run=lambda cmd: None)
 
     def tearDown(self):
         self.interface.stop_all()
-        os.system('pkill -f key-mapper-service')
-
-        for _ in range(10):
-            time.sleep(0.1)
-            if not is_service_running():
-                break
+        os.kill(self.process.pid, signal.SIGTERM)
+        # waits for the process to exit
+        self.process.join(timeout=1)
 
         self.assertFalse(is_service_running())
 
@@ -81,55 +77,64 @@ class TestDBusDaemon(unittest.TestCase):
         self.assertEqual(self.interface.hello('foo'), 'foo')
 
 
-check_output = subprocess.check_output
-os_system = os.system
-dbus_get = type(SystemBus()).get
-
-
 class TestDaemon(unittest.TestCase):
     new_fixture_path = '/dev/input/event9876'
 
-    def setUp(self):
-        self.grab = evdev.InputDevice.grab
-        self.daemon = None
+    @classmethod
+    def setUpClass(cls):
+        # quick_cleanup writes the config again after each test
         mkdir(get_config_path())
         config.save_config()
 
+    def setUp(self):
+        self.daemon = None
+
     def tearDown(self):
         # avoid race conditions with other tests, daemon may run processes
         if self.daemon is not None:
             self.daemon.stop_all()
             self.daemon = None
-        evdev.InputDevice.grab = self.grab
-
-        subprocess.check_output = check_output
-        os.system = os_system
-        type(SystemBus()).get = dbus_get
 
-        cleanup()
+        # no service is started in those tests, so there is nothing to kill
+        # and the groups only need to be restored instead of discovered again
+        quick_cleanup()
+        restore_groups()
 
     def test_connect(self):
-        os_system_history = []
-        os.system = os_system_history.append
+        run_history = []
 
         self.assertFalse(is_service_running())
         # no daemon runs, should try to run it via pkexec instead.
-        # It fails due to the patch and therefore exits the process
-        self.assertRaises(SystemExit, Daemon.connect)
-        self.assertEqual(len(os_system_history), 1)
+        # It doesn't actually start anything and therefore exits the process
+        self.assertRaises(
+            SystemExit,
+            lambda: Daemon.connect(run=run_history.append)
+        )
+        self.assertEqual(len(run_history), 1)
+        self.assertEqual(run_history[0][0], 'pkexec')
         self.assertIsNone(Daemon.connect(False))
 
         class FakeConnection:
             pass
 
-        type(SystemBus()).get = lambda *args: FakeConnection()
-        self.assertIsInstance(Daemon.connect(), FakeConnection)
-        self.assertIsInstance(Daemon.connect(False), FakeConnection)
+        class FakeBus:
+            def get(self, *args):
+                return FakeConnection()
+
+        bus = FakeBus()
+        self.assertIsInstance(Daemon.connect(bus=bus), FakeConnection)
+        self.assertIsInstance(Daemon.connect(False, bus), FakeConnection)
+
+        class UnavailableBus:
+            def get(self, *args):
+                raise GLib.GError('The name is not activatable')
+
+        # for example during udev coldplug before dbus is up
+        self.assertIsNone(Daemon.connect(False, UnavailableBus()))
 
     def test_daemon(self):
         # remove the existing system mapping to force our own into it
-        if os.path.exists(get_config_path('xmodmap.json')):
-            os.remove(get_config_path('xmodmap.json'))
+        remove(get_config_path('xmodmap.json'))
 
         ev_1 = (EV_KEY, 9)
         ev_2 = (EV_ABS, 12)
@@ -180,9 +185,8 @@ class TestDaemon(unittest.TestCase):
         self.daemon.stop_injecting(group.key)
         self.assertEqual(self.daemon.get_state(group.key), STOPPED)
 
-        time.sleep(0.1)
         try:
-            self.assertFalse(uinput_write_history_pipe[0].poll())
+            self.assertFalse(uinput_write_history_pipe[0].poll(timeout=0.1))
         except AssertionError:
             print('Unexpected', uinput_write_history_pipe[0].recv())
             # possibly a duplicate write!
@@ -197,8 +201,8 @@ class TestDaemon(unittest.TestCase):
 
         self.daemon.start_injecting(group.key, preset)
 
-        time.sleep(0.1)
-        self.assertTrue(uinput_write_history_pipe[0].poll())
+        # blocks until the event arrives
+        self.assertTrue(uinput_write_history_pipe[0].poll(timeout=1))
 
         # the written key is a key-down event, not the original
         # event value of -1234
@@ -209,8 +213,8 @@ class TestDaemon(unittest.TestCase):
         self.assertEqual(event.value, 1)
 
     def test_refresh_on_start(self):
-        if os.path.exists(get_config_path('xmodmap.json')):
-            os.remove(get_config_path('xmodmap.json'))
+        xmodmap_path = get_config_path('xmodmap.json')
+        remove(xmodmap_path)
 
         ev = (EV_KEY, 9)
         keycode_to = 100
@@ -227,8 +231,8 @@ class TestDaemon(unittest.TestCase):
         system_mapping._set('a', keycode_to)
 
         # make the daemon load the file instead
-        with open(get_config_path('xmodmap.json'), 'w') as file:
-            json.dump(system_mapping._mapping, file, indent=4)
+        with open(xmodmap_path, 'w') as file:
+            file.write(json.dumps(system_mapping._mapping, indent=4))
         system_mapping.clear()
 
         preset = 'foo'
@@ -258,8 +262,8 @@ class TestDaemon(unittest.TestCase):
         self.assertEqual(group.name, group_name)
         self.assertEqual(group.key, group_key)
 
-        time.sleep(0.1)
-        self.assertTrue(uinput_write_history_pipe[0].poll())
+        # blocks until the event arrives
+        self.assertTrue(uinput_write_history_pipe[0].poll(timeout=1))
 
         event = uinput_write_history_pipe[0].recv()
         self.assertEqual(event.t, (EV_KEY, keycode_to, 1))
@@ -330,14 +334,35 @@ class TestDaemon(unittest.TestCase):
 
         self.daemon.start_injecting(group.key, preset)
 
-        time.sleep(0.1)
-        self.assertTrue(uinput_write_history_pipe[0].poll())
+        # blocks until the event arrives
+        self.assertTrue(uinput_write_history_pipe[0].poll(timeout=1))
 
         event = uinput_write_history_pipe[0].recv()
         self.assertEqual(event.type, EV_KEY)
         self.assertEqual(event.code, to_keycode)
         self.assertEqual(event.value, 1)
 
+    def test_load_xmodmap(self):
+        path = get_config_path('xmodmap.json')
+        # system_mapping.populate writes it for non-root users
+        remove(path)
+        self.daemon = Daemon()
+        self.assertRaises(FileNotFoundError, self.daemon._load_xmodmap, path)
+
+        mkdir(get_config_path())
+        with open(path, 'w') as file:
+            file.write('{"foo": 1}')
+
+        xmodmap = self.daemon._load_xmodmap(path)
+        self.assertEqual(xmodmap, {'foo': 1})
+        # unchanged files are not parsed again
+        self.assertIs(self.daemon._load_xmodmap(path), xmodmap)
+
+        with open(path, 'w') as file:
+            file.write('{"foo": 1, "bar": 2}')
+
+        self.assertEqual(self.daemon._load_xmodmap(path), {'foo': 1, 'bar': 2})
+
     def test_start_stop(self):
         group = groups.find(key='Foo Device 2')
         preset = 'preset8'
@@ -399,6 +424,14 @@ class TestDaemon(unittest.TestCase):
         self.assertEqual(daemon.injectors[group.key].get_state(), STOPPED)
         self.assertTrue(daemon.autoload_history.may_autoload(group.key, preset))
 
+        # stop all
+        daemon.start_injecting(group.key, preset)
+        injector = daemon.injectors[group.key]
+        daemon.stop_all()
+        self.assertEqual(len(daemon.injectors), 0)
+        self.assertEqual(daemon.get_state(group.key), UNKNOWN)
+        self.assertEqual(injector.get_state(), STOPPED)
+
     def test_autoload(self):
         preset = 'preset7'
         group = groups.find(key='Foo Device 2')
@@ -423,14 +456,14 @@ class TestDaemon(unittest.TestCase):
         # now autoloading is configured, so it will autoload
         self.daemon._autoload(group.key)
         len_after = len(self.daemon.autoload_history._autoload_history)
-        self.assertEqual(daemon.autoload_history._autoload_history[group.key][1], preset)
+        self.assertEqual(daemon.autoload_history._autoload_history[group.key].preset, preset)
         self.assertFalse(daemon.autoload_history.may_autoload(group.key, preset))
         injector = daemon.injectors[group.key]
         self.assertEqual(len_before + 1, len_after)
 
         # calling duplicate _autoload does nothing
         self.daemon._autoload(group.key)
-        self.assertEqual(daemon.autoload_history._autoload_history[group.key][1], preset)
+        self.assertEqual(daemon.autoload_history._autoload_history[group.key].preset, preset)
         self.assertEqual(injector, daemon.injectors[group.key])
         self.assertFalse(daemon.autoload_history.may_autoload(group.key, preset))
 
@@ -444,12 +477,32 @@ class TestDaemon(unittest.TestCase):
         len_after = len(self.daemon.autoload_history._autoload_history)
         self.assertEqual(len_before, len_after)
 
-        # autoloading key-mapper devices does nothing
+        # autoloading key-mapper devices does nothing, not even schedule it
         len_before = len(self.daemon.autoload_history._autoload_history)
-        self.daemon.autoload_single('Bar Device')
+        self.daemon.autoload_single('key-mapper Bar Device')
+        self.assertNotIn('key-mapper Bar Device', daemon._autoload_timeouts)
+        wait_for_autoload()
         len_after = len(self.daemon.autoload_history._autoload_history)
         self.assertEqual(len_before, len_after)
 
+    def test_autoload_single_debounce(self):
+        self.daemon = Daemon()
+        history = []
+        self.daemon._autoload = history.append
+        self.daemon.set_config_dir(get_config_path())
+
+        # a burst of udev events for the same group
+        for _ in range(3):
+            self.daemon.autoload_single('Foo Device 2')
+        self.daemon.autoload_single('gamepad')
+        self.assertEqual(len(history), 0)
+        self.assertEqual(len(self.daemon._autoload_timeouts), 2)
+
+        wait_for_autoload()
+
+        self.assertEqual(sorted(history), ['Foo Device 2', 'gamepad'])
+        self.assertEqual(len(self.daemon._autoload_timeouts), 0)
+
     def test_autoload_2(self):
         self.daemon = Daemon()
         history = self.daemon.autoload_history._autoload_history
@@ -473,7 +526,7 @@ class TestDaemon(unittest.TestCase):
         self.daemon.set_config_dir(get_config_path())
         self.daemon.autoload()
         self.assertEqual(len(history), 1)
-        self.assertEqual(history[group.key][1], preset)
+        self.assertEqual(history[group.key].preset, preset)
 
     def test_autoload_3(self):
         # based on a bug
@@ -496,10 +549,24 @@ class TestDaemon(unittest.TestCase):
         # it should try to refresh the groups because all the
         # group_keys are unknown at the moment
         history = self.daemon.autoload_history._autoload_history
-        self.assertEqual(history[group.key][1], preset)
+        self.assertEqual(history[group.key].preset, preset)
         self.assertEqual(self.daemon.get_state(group.key), STARTING)
         self.assertIsNotNone(groups.find(key='Foo Device 2'))
 
+    def test_autoload_refreshes_once(self):
+        config.set_autoload_preset('unknown-key-1', 'preset1')
+        config.set_autoload_preset('unknown-key-2', 'preset2')
+        config.save_config()
+
+        self.daemon = Daemon()
+        self.daemon.set_config_dir(get_config_path())
+        # recent enough, only unknown groups cause a refresh
+        self.daemon.refreshed_devices_at = time.monotonic()
+
+        with spy(groups, 'refresh') as refresh:
+            self.daemon.autoload()
+            self.assertEqual(refresh.call_count, 1)
+
 
 if __name__ == "__main__":
     unittest.main()
@@ -132,6 +132,31 @@ class TestGroups(unittest.TestCase):
         self.assertIn('Foo Device 2', keys)
         self.assertNotIn('key-mapper Bar Device', keys)
 
+    def test_find_by_path(self):
+        group = groups.find(path='/dev/input/event10')
+        self.assertEqual(group.key, 'Foo Device 2')
+        self.assertEqual(groups.find(path='/dev/input/event10', key='Foo Device 2'), group)
+        self.assertIsNone(groups.find(path='/dev/input/event10', key='Foo Device'))
+        self.assertIsNone(groups.find(path='/dev/input/event10', name='gamepad'))
+        self.assertIsNone(groups.find(path='/dev/input/event1234'))
+
+        # the index is updated when the groups change
+        groups.set_groups([])
+        self.assertIsNone(groups.find(path='/dev/input/event10'))
+        groups.refresh()
+        self.assertEqual(groups.find(path='/dev/input/event10').key, 'Foo Device 2')
+
+    def test_find_by_key_and_name(self):
+        group = groups.find(key='Foo Device 2')
+        self.assertEqual(group.name, 'Foo Device')
+        self.assertEqual(groups.find(key='Foo Device 2', name='Foo Device'), group)
+        self.assertIsNone(groups.find(key='Foo Device 2', name='Bar Device'))
+        self.assertIsNone(groups.find(key='Foo Device 1234'))
+
+        # not unique, the first one is returned
+        self.assertEqual(groups.find(name='Foo Device').key, 'Foo Device')
+        self.assertIsNone(groups.find(name='Foo Device 1234'))
+
     def test_skip_camera(self):
         fixtures['/foo/bar'] = {
             'name': 'camera', 'phys': 'abcd1',
@@ -112,6 +112,15 @@ class TestInjector(unittest.TestCase):
         self.assertFalse(self.injector.is_alive())
         self.assertEqual(self.injector.get_state(), NO_GRAB)
 
+    def test_final_state(self):
+        self.injector = Injector(groups.find(key='Foo Device 2'), custom_mapping)
+        self.injector.stop_injecting()
+
+        # the process isn't checked anymore once a final state is reached
+        with mock.patch.object(self.injector, 'is_alive') as is_alive_patch:
+            self.assertEqual(self.injector.get_state(), STOPPED)
+            is_alive_patch.assert_not_called()
+
     def test_grab_device_1(self):
         custom_mapping.change(Key(EV_ABS, ABS_HAT0X, 1), 'a')
         self.injector = Injector(groups.find(name='gamepad'), custom_mapping)
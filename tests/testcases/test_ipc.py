@@ -19,12 +19,15 @@
 # along with key-mapper.  If not, see <https://www.gnu.org/licenses/>.
 
 
+import os
 import unittest
 import select
 
 from keymapper.ipc.pipe import Pipe
 from keymapper.ipc.socket import Server, Client, Base
 
+from tests.test import tmp
+
 
 class TestSocket(unittest.TestCase):
     def test_socket(self):
@@ -47,21 +50,21 @@ class TestSocket(unittest.TestCase):
             self.assertFalse(s2.poll())
             self.assertEqual(s2.recv(), None)
 
-        server = Server('/tmp/key-mapper-test/socket1')
-        client = Client('/tmp/key-mapper-test/socket1')
+        server = Server(os.path.join(tmp, 'socket1'))
+        client = Client(os.path.join(tmp, 'socket1'))
         test(server, client)
 
-        client = Client('/tmp/key-mapper-test/socket2')
-        server = Server('/tmp/key-mapper-test/socket2')
+        client = Client(os.path.join(tmp, 'socket2'))
+        server = Server(os.path.join(tmp, 'socket2'))
         test(client, server)
 
     def test_not_connected_1(self):
         # client discards old message, because it might have had a purpose
         # for a different client and not for the current one
-        server = Server('/tmp/key-mapper-test/socket3')
+        server = Server(os.path.join(tmp, 'socket3'))
         server.send(1)
 
-        client = Client('/tmp/key-mapper-test/socket3')
+        client = Client(os.path.join(tmp, 'socket3'))
         server.send(2)
 
         self.assertTrue(client.poll())
@@ -70,10 +73,10 @@ class TestSocket(unittest.TestCase):
         self.assertEqual(client.recv(), None)
 
     def test_not_connected_2(self):
-        client = Client('/tmp/key-mapper-test/socket4')
+        client = Client(os.path.join(tmp, 'socket4'))
         client.send(1)
 
-        server = Server('/tmp/key-mapper-test/socket4')
+        server = Server(os.path.join(tmp, 'socket4'))
         client.send(2)
 
         self.assertTrue(server.poll())
@@ -83,8 +86,8 @@ class TestSocket(unittest.TestCase):
 
     def test_select(self):
         """is compatible to select.select"""
-        server = Server('/tmp/key-mapper-test/socket6')
-        client = Client('/tmp/key-mapper-test/socket6')
+        server = Server(os.path.join(tmp, 'socket6'))
+        client = Client(os.path.join(tmp, 'socket6'))
 
         server.send(1)
         ready = select.select([client], [], [], 0)[0][0]
@@ -103,7 +106,7 @@ class TestSocket(unittest.TestCase):
 
 class TestPipe(unittest.TestCase):
     def test_pipe_single(self):
-        p1 = Pipe('/tmp/key-mapper-test/pipe')
+        p1 = Pipe(os.path.join(tmp, 'pipe'))
         self.assertEqual(p1.recv(), None)
 
         p1.send(1)
@@ -123,8 +126,8 @@ class TestPipe(unittest.TestCase):
         self.assertEqual(p1.recv(), None)
 
     def test_pipe_duo(self):
-        p1 = Pipe('/tmp/key-mapper-test/pipe')
-        p2 = Pipe('/tmp/key-mapper-test/pipe')
+        p1 = Pipe(os.path.join(tmp, 'pipe'))
+        p2 = Pipe(os.path.join(tmp, 'pipe'))
         self.assertEqual(p2.recv(), None)
 
         p1.send(1)